@@ -0,0 +1,365 @@
+"""
+Azure OpenAI Client Module
+
+This module contains the Azure OpenAI configuration and the shared
+AsyncAzureOpenAI client reused by every plugin and agent, so they all draw
+from one credential, one token cache and one connection pool, along with
+the helpers the agents share for running requests and tool calls.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import importlib.util
+import threading
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from azure.identity import AzureCliCredential
+import httpx
+import openai
+from openai.types.chat import ChatCompletion
+
+from dotenv import load_dotenv
+
+from llm_cache import ResponseCache, hash_request
+
+try:
+    import aiohttp
+    from httpx_aiohttp import AiohttpTransport
+except ImportError:
+    # The aiohttp transport is optional; fall back to httpx's own connection pool
+    AiohttpTransport = None
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; fall back to the slower standard library json module
+    orjson = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 needs the optional h2 package (httpx[http2]); without it httpx falls back to HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Scope requested for Azure OpenAI access tokens
+TOKEN_SCOPE = "https://cognitiveservices.azure.com/.default"
+
+# Refresh Azure AD tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 300
+
+# Batch job states after which a job no longer changes
+BATCH_TERMINAL_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
+
+
+@dataclass(frozen=True)
+class AzureOpenAIConfig:
+    """Azure OpenAI settings, read once from the environment at import time"""
+    endpoint: Optional[str]
+    deployment: Optional[str]
+    batch_deployment: Optional[str]
+    embedding_deployment: str = "text-embedding-3-small"
+    concurrency: int = 8
+    requests_per_minute: int = 0
+    tokens_per_minute: int = 0
+    http_backend: str = "aiohttp"
+    api_version: str = "2024-10-21"
+
+
+AZURE_OPENAI_CONFIG = AzureOpenAIConfig(
+    endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+    deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+    batch_deployment=os.getenv("AZURE_OPENAI_BATCH_DEPLOYMENT_NAME") or os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+    embedding_deployment=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME", "text-embedding-3-small"),
+    concurrency=int(os.getenv("AZURE_OPENAI_CONCURRENCY", 8)),
+    requests_per_minute=int(os.getenv("AZURE_OPENAI_RPM", 0)),
+    tokens_per_minute=int(os.getenv("AZURE_OPENAI_TPM", 0)),
+    http_backend=os.getenv("AZURE_OPENAI_HTTP_BACKEND", "aiohttp").lower(),
+    api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21"),
+)
+
+
+class AsyncTokenBucket:
+    """Paces requests to stay within a requests-per-minute and a tokens-per-minute budget
+
+    Both budgets start full and refill continuously, so bursts up to the
+    per-minute limits go out immediately and sustained load is spread out
+    instead of running into 429 responses. A limit of 0 disables that budget.
+    Waiting callers are served in arrival order.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        """
+        Initialize the bucket
+
+        Args:
+            requests_per_minute: Deployment request rate limit, or 0 for no limit
+            tokens_per_minute: Deployment token rate limit, or 0 for no limit
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int = 0) -> None:
+        """Wait until a request with the given estimated token count fits both budgets, then consume it"""
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return
+
+        # A request larger than the whole token budget only has to wait for a full bucket
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                self._refill()
+                waits = []
+                if self.requests_per_minute and self._requests < 1:
+                    waits.append((1 - self._requests) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute and self._tokens < tokens:
+                    waits.append((tokens - self._tokens) * 60 / self.tokens_per_minute)
+                if not waits:
+                    break
+                await asyncio.sleep(max(waits))
+
+            if self.requests_per_minute:
+                self._requests -= 1
+            if self.tokens_per_minute:
+                self._tokens -= tokens
+
+    def _refill(self) -> None:
+        """Add the budget accrued since the last refill"""
+        now = time.monotonic()
+        elapsed, self._updated = now - self._updated, now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+
+# Shared by every caller of the deployment, since Azure enforces the limits per deployment
+RATE_LIMITER = AsyncTokenBucket(AZURE_OPENAI_CONFIG.requests_per_minute, AZURE_OPENAI_CONFIG.tokens_per_minute)
+
+# Caps the requests in flight across all plugins and agents, so bursts don't end in 429 retry cycles
+LLM_SEMAPHORE = asyncio.Semaphore(AZURE_OPENAI_CONFIG.concurrency)
+
+_credential: Optional[AzureCliCredential] = None
+_token_provider: Optional[Callable[[], str]] = None
+_client: Optional[openai.AsyncAzureOpenAI] = None
+_lock = threading.Lock()
+
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    """Parse JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(value: Any) -> bytes:
+    """Serialize a value to compact UTF-8 JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def cached_token_provider(credential: AzureCliCredential, scope: str = TOKEN_SCOPE) -> Callable[[], str]:
+    """Return an Azure AD token provider that reuses the token until it is close to expiry"""
+    cache = {}
+
+    def get_token() -> str:
+        token = cache.get("token")
+        if token is None or token.expires_on - TOKEN_REFRESH_MARGIN <= time.time():
+            token = credential.get_token(scope)
+            cache["token"] = token
+        return token.token
+
+    return get_token
+
+
+def get_credential() -> AzureCliCredential:
+    """Return the shared Azure CLI credential, creating it on first use"""
+    global _credential
+    with _lock:
+        if _credential is None:
+            _credential = AzureCliCredential()
+        return _credential
+
+
+def get_token_provider() -> Callable[[], str]:
+    """Return the shared cached Azure AD token provider, creating it on first use"""
+    global _token_provider
+    credential = get_credential()
+    with _lock:
+        if _token_provider is None:
+            _token_provider = cached_token_provider(credential)
+        return _token_provider
+
+
+def _create_http_client() -> httpx.AsyncClient:
+    """Create the HTTP client used by the shared OpenAI client"""
+    if AZURE_OPENAI_CONFIG.http_backend == "aiohttp" and AiohttpTransport is not None:
+        # aiohttp keeps throughput up under the high concurrency of research fan-out.
+        # The session is created lazily on the first request, inside the event loop.
+        transport = AiohttpTransport(
+            client=lambda: aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=128, limit_per_host=128, ttl_dns_cache=300)
+            )
+        )
+        return openai.DefaultAsyncHttpxClient(transport=transport)
+    
+    # HTTP/2 multiplexes concurrent requests over a few connections, each paying the TLS handshake once.
+    # The transport retries only failed connection attempts; the SDK retries failed requests itself.
+    transport = httpx.AsyncHTTPTransport(
+        http2=HTTP2_AVAILABLE,
+        retries=2,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60)
+    )
+    # Every long generation is streamed, so the read timeout only bounds the wait for the next chunk
+    # (or for the first one, while a long prompt is processed)
+    return openai.DefaultAsyncHttpxClient(
+        transport=transport,
+        timeout=httpx.Timeout(connect=5.0, read=120.0, write=15.0, pool=5.0)
+    )
+
+
+def get_async_client() -> openai.AsyncAzureOpenAI:
+    """Return the shared AsyncAzureOpenAI client, creating it on first use"""
+    global _client
+    token_provider = get_token_provider()
+    with _lock:
+        if _client is None:
+            _client = openai.AsyncAzureOpenAI(
+                azure_endpoint=AZURE_OPENAI_CONFIG.endpoint,
+                azure_ad_token_provider=token_provider,
+                api_version=AZURE_OPENAI_CONFIG.api_version,
+                http_client=_create_http_client()
+            )
+        return _client
+
+
+async def warmup_async_client() -> None:
+    """Fetch the first Azure AD token and open a connection before the first real request"""
+    # The Azure CLI credential is synchronous and slow on first use, so keep it off the event loop
+    await asyncio.get_running_loop().run_in_executor(None, get_token_provider())
+    await get_async_client().chat.completions.create(
+        model=AZURE_OPENAI_CONFIG.deployment,
+        messages=[{"role": "user", "content": "ping"}],
+        max_tokens=1
+    )
+
+
+async def close_async_client() -> None:
+    """Close the shared client and its connections; call once on application shutdown"""
+    global _client
+    with _lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.close()
+
+
+async def dispatch_tool_call(tool_call: Any, tool_functions: Dict[str, Callable[..., Awaitable[str]]],
+                             tools: List[Dict[str, Any]]) -> Tuple[str, str]:
+    """
+    Run the function requested by a tool call, returning the tool call id and its result
+
+    Only the arguments declared in the tool's schema are passed on, so
+    extra or hallucinated arguments from the model are dropped. A failing
+    call returns an error message as its result instead of raising, so it
+    doesn't fail the other tool calls of the turn.
+
+    Args:
+        tool_call: The tool call from the model's response
+        tool_functions: The callable for each tool name
+        tools: The tool definitions sent to the model
+
+    Returns:
+        The tool call id and the function's result or error message
+    """
+    function_name = tool_call.function.name
+    function = tool_functions.get(function_name)
+    if function is None:
+        return tool_call.id, f"Unknown function: {function_name}"
+
+    parameters = next(
+        (tool["function"]["parameters"]["properties"] for tool in tools if tool["function"]["name"] == function_name),
+        {}
+    )
+    try:
+        function_args = json_loads(tool_call.function.arguments or "{}")
+        if not isinstance(function_args, dict):
+            raise ValueError("tool call arguments are not a JSON object")
+        function_args = {name: value for name, value in function_args.items() if name in parameters}
+        return tool_call.id, await function(**function_args)
+    except Exception as e:
+        logger.exception("Error in tool call %s", function_name)
+        return tool_call.id, f"❌ {function_name} failed: {str(e)}"
+
+
+async def run_chat_completion_batch(client: openai.AsyncAzureOpenAI, requests: List[Dict[str, Any]],
+                                    cache: Optional[ResponseCache] = None,
+                                    poll_interval: float = 5.0,
+                                    max_poll_interval: float = 60.0) -> List[Optional[ChatCompletion]]:
+    """
+    Run chat completion requests as one Batch API job and wait for the results
+
+    Batch jobs are billed at a discount but can take minutes to hours, so
+    this is only suitable for callers that tolerate that latency. Requests
+    are written as for the online deployment and sent to the batch
+    deployment; they must not stream.
+
+    Args:
+        client: The AsyncAzureOpenAI client
+        requests: Keyword arguments for chat.completions.create, one dict per request
+        cache: Optional response cache to store each completion in under its online request's key,
+            so later online requests for the same input are answered without another call
+        poll_interval: Initial seconds between job status checks, doubled after each check
+        max_poll_interval: Upper bound for the seconds between job status checks
+
+    Returns:
+        The completion for each request in input order, or None where that request failed
+    """
+    lines = b"\n".join(
+        json_dumps({
+            "custom_id": str(index),
+            "method": "POST",
+            "url": "/chat/completions",
+            "body": dict(request, model=AZURE_OPENAI_CONFIG.batch_deployment)
+        })
+        for index, request in enumerate(requests)
+    )
+    input_file = await client.files.create(file=("batch.jsonl", lines), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=input_file.id, endpoint="/chat/completions", completion_window="24h"
+    )
+    logger.info("Submitted batch %s with %d requests", batch.id, len(requests))
+
+    try:
+        while batch.status not in BATCH_TERMINAL_STATUSES:
+            await asyncio.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, max_poll_interval)
+            batch = await client.batches.retrieve(batch.id)
+    except asyncio.CancelledError:
+        # Don't leave the job running (and billed) when nobody waits for it
+        await client.batches.cancel(batch.id)
+        raise
+
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'")
+
+    results: List[Optional[ChatCompletion]] = [None] * len(requests)
+    if batch.output_file_id:
+        output = await client.files.content(batch.output_file_id)
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            result = json_loads(line)
+            response = result.get("response") or {}
+            if response.get("status_code") == 200:
+                index = int(result["custom_id"])
+                results[index] = ChatCompletion.model_validate(response["body"])
+                if cache is not None:
+                    cache.set(hash_request(**requests[index]), response["body"])
+    return results
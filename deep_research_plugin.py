@@ -5,42 +5,128 @@ This module contains the DeepResearchPlugin for performing comprehensive
 multi-level research using OpenAI API with function calling.
 """
 
-import os
+import re
 import asyncio
 import logging
 import datetime
-import json
-from typing import List, Optional, Dict, Any
+from typing import Any, AsyncIterator, Dict, Hashable, List, Optional, Tuple
 
-from azure.identity import AzureCliCredential
-import openai
+from openai.types.chat import ChatCompletion
 
-from dotenv import load_dotenv
+from azure_openai_client import (
+    AZURE_OPENAI_CONFIG, LLM_SEMAPHORE, RATE_LIMITER, dispatch_tool_call, get_async_client,
+    run_chat_completion_batch, warmup_async_client
+)
+from llm_cache import (
+    LLM_CACHE_PATH, SEMANTIC_CACHE_ENABLED, ResponseCache, SemanticCache, cached_completion, has_response
+)
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the application; this module only emits records
 logger = logging.getLogger(__name__)
 
-load_dotenv()
+# Responses to identical chat completion requests are reused for an hour
+RESEARCH_CACHE = ResponseCache(maxsize=512, ttl=3600, path=LLM_CACHE_PATH)
+
+# Outlines and findings are also reused for differently worded but equivalent queries
+SEMANTIC_RESEARCH_CACHE = SemanticCache(AZURE_OPENAI_CONFIG.embedding_deployment, threshold=0.93)
+
+# Matches one numbered ("1." / "1)") or bulleted ("-" / "•" / "*") outline line and captures its text;
+# a leading "**" is markdown bold rather than a bullet
+ASPECT_LINE_PATTERN = re.compile(r"^[ \t]*(?:\d+[.)]|[-•]|\*(?!\*))[ \t]*(\S.*?)[ \t\r]*$", re.MULTILINE)
+
+# Matches queries without any word characters (e.g. "", "?"), which are not worth researching
+TRIVIAL_QUERY_PATTERN = re.compile(r"^\W*$")
+
+# Quick research on queries shorter than this many words researches the query directly, without an outline
+QUICK_RESEARCH_MIN_OUTLINE_WORDS = 3
+
+# Generic research aspects used when the outline cannot be generated or parsed
+GENERIC_ASPECT_TEMPLATES = (
+    "Current state and overview of {query}",
+    "Recent developments and trends in {query}",
+    "Key challenges and opportunities in {query}",
+    "Future implications and predictions for {query}",
+    "Expert opinions and analysis on {query}",
+    "Technical aspects and specifications of {query}",
+    "Economic and market impact of {query}",
+    "Social and cultural effects of {query}",
+    "Regulatory and legal considerations for {query}",
+    "Comparative analysis and alternatives to {query}",
+)
+
+# System prompts are kept byte-identical across calls so Azure OpenAI prompt caching
+# can reuse the prefix; everything request-specific goes into the user message.
+OUTLINE_SYSTEM_MESSAGE = """You are a research planning specialist. Generate the requested number of specific research aspects for comprehensive analysis of the topic given by the user.
+
+Create focused research areas that are:
+- Specific and actionable
+- Comprehensive and covering different dimensions
+- Relevant to the topic
+- Suitable for detailed investigation
+
+Format your response as a numbered list of research aspects, each on a new line.
+Example format:
+1. [Specific research aspect]
+2. [Another specific research aspect]
+etc.
+
+Focus on practical, investigatable aspects that would provide valuable insights."""
+
+RESEARCH_SYSTEM_MESSAGE = """You are a specialized research analyst conducting iterative research on the aspect given by the user.
+
+Provide a detailed, factual analysis focusing on:
+- Current state and recent developments
+- Key facts, statistics, and data points
+- Important trends and patterns
+- Challenges and opportunities
+- Expert insights and analysis
+- Future implications
+
+Format your response as clear, actionable bullet points with specific details.
+Be thorough, factual, and provide valuable insights that go beyond general statements.
+Focus on concrete information and actionable intelligence."""
+
+AGENT_SYSTEM_MESSAGE = """You are an expert deep research agent capable of performing comprehensive, multi-level research on any topic.
+
+You have access to research functions that can help you provide detailed analysis. When a user asks you to research something, you should:
+
+1. Use the appropriate research function (deep_research for comprehensive analysis, quick_research for faster results)
+2. Provide detailed, factual analysis focusing on:
+   - Current state and recent developments
+   - Key facts, statistics, and data points
+   - Important trends and patterns
+   - Challenges and opportunities
+   - Expert insights and analysis
+   - Future implications
+
+Always provide well-structured, detailed reports with clear insights.
+Be thorough, factual, and provide valuable analysis that goes beyond surface-level information.
+Your research should be comprehensive, well-organized, and actionable."""
 
 
 class DeepResearchPlugin:
     """An OpenAI-based plugin for performing deep, multi-level research on topics"""
     
+    # Shared with every other caller of the deployment so concurrent research
+    # runs and risk assessments stay within the rate limits together
+    llm_semaphore = LLM_SEMAPHORE
+    
     def __init__(self):
         """Initialize the Deep Research Plugin"""
-        self.logger = logging.getLogger(__name__)
-        self.logger.debug("Deep Research Plugin initialized")
-        
-        # Initialize OpenAI client
-        self._credential = AzureCliCredential()
-        self.client = openai.AsyncAzureOpenAI(
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            azure_ad_token_provider=lambda: self._credential.get_token("https://cognitiveservices.azure.com/.default").token,
-            api_version="2024-02-01"
-        )
-        
-    async def deep_research(self, query: str, breadth: int = 3, depth: int = 2) -> str:
+        logger.debug("Deep Research Plugin initialized")
+        
+        # Reuse the shared OpenAI client
+        self.client = get_async_client()
+
+    async def warmup(self) -> None:
+        """Fetch the Azure AD token and open a connection ahead of the first research request"""
+        try:
+            await warmup_async_client()
+        except Exception:
+            # Warmup is only an optimization; real requests will retry the same steps
+            logger.warning("Azure OpenAI warmup failed", exc_info=True)
+        
+    async def deep_research(self, query: str, breadth: int = 3, depth: int = 2, use_batch_api: bool = False) -> str:
         """
         Perform comprehensive deep research on a given topic
         
@@ -48,34 +134,73 @@ class DeepResearchPlugin:
             query: The research topic or question
             breadth: Number of research aspects to explore (1-10)
             depth: Number of research iterations (1-5)
+            use_batch_api: Research the aspects through one discounted Batch API job,
+                which can take minutes to hours to complete
             
         Returns:
             Comprehensive research report in markdown format
         """
         try:
-            # Validate parameters
-            breadth = max(1, min(10, breadth))
-            depth = max(1, min(5, depth))
+            if not isinstance(query, str) or TRIVIAL_QUERY_PATTERN.match(query):
+                return "❌ Please provide a research topic."
             
-            logger.info(f"Starting deep research on: '{query}' (breadth: {breadth}, depth: {depth})")
-            
-            # Generate research outline
-            research_outline = await self._generate_research_outline(query, breadth)
-            
-            # Perform iterative research
-            research_results = await self._perform_iterative_research(query, research_outline, depth)
-            
-            # Generate final comprehensive report
-            final_report = await self._generate_final_report(query, research_results, breadth, depth)
-            
-            logger.info(f"Deep research completed on: '{query}'")
-            
-            return final_report
+            return "".join([
+                section async for section in self.deep_research_stream(query, breadth, depth, use_batch_api)
+            ])
             
         except Exception as e:
-            logger.error(f"Error in deep research: {e}")
+            logger.exception("Error in deep research")
             return f"❌ Deep research failed: {str(e)}"
 
+    async def deep_research_stream(self, query: str, breadth: int = 3, depth: int = 2,
+                                   use_batch_api: bool = False) -> AsyncIterator[str]:
+        """
+        Perform deep research and yield the markdown report section by section
+        
+        The report header is yielded as soon as the outline is ready, and each
+        aspect's section as soon as its findings (and those of the aspects
+        before it) are available, so callers can render the report while the
+        remaining aspects are still being researched.
+        
+        Args:
+            query: The research topic or question
+            breadth: Number of research aspects to explore (1-10)
+            depth: Number of research iterations (1-5)
+            use_batch_api: Research the aspects through one discounted Batch API job,
+                which can take minutes to hours to complete
+            
+        Yields:
+            Consecutive sections of the research report in markdown format
+        """
+        # Validate parameters
+        breadth = max(1, min(10, breadth))
+        depth = max(1, min(5, depth))
+        
+        logger.info("Starting deep research on: '%s' (breadth: %d, depth: %d)", query, breadth, depth)
+        
+        # Generate research outline; a single aspect is the query itself, so no outline call is needed
+        if breadth == 1:
+            research_outline = [query.strip()]
+        else:
+            research_outline = await self._generate_research_outline(query, breadth)
+        
+        # Start researching every aspect concurrently
+        if use_batch_api:
+            research_tasks = self._perform_batch_research(research_outline, depth)
+        else:
+            research_tasks = self._perform_iterative_research(query, research_outline, depth)
+        
+        try:
+            # Stream the final comprehensive report as the findings arrive
+            async for section in self._generate_final_report(query, research_outline, research_tasks, breadth, depth):
+                yield section
+        finally:
+            # Don't leave research running if the caller stops consuming early
+            for task in research_tasks:
+                task.cancel()
+        
+        logger.info("Deep research completed on: '%s'", query)
+
     async def quick_research(self, query: str) -> str:
         """
         Perform quick research with preset parameters for faster results
@@ -86,169 +211,197 @@ class DeepResearchPlugin:
         Returns:
             Research summary in markdown format
         """
-        return await self.deep_research(query, breadth=2, depth=1)
+        # Short queries are researched directly, cutting the LLM calls to one
+        words = query.split() if isinstance(query, str) else []
+        breadth = 1 if len(words) < QUICK_RESEARCH_MIN_OUTLINE_WORDS else 2
+        return await self.deep_research(query, breadth=breadth, depth=1)
 
     async def _generate_research_outline(self, query: str, breadth: int) -> List[str]:
         """Generate an AI-powered research outline with multiple aspects to explore"""
         
+        request = {
+            "model": AZURE_OPENAI_CONFIG.deployment,
+            "messages": [
+                {"role": "system", "content": OUTLINE_SYSTEM_MESSAGE},
+                {"role": "user", "content": f"Generate {breadth} specific research aspects for comprehensive analysis of: {query}"}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 1000
+        }
+        
+        semantic_key = ("research_outline", breadth)
+        cached_aspects, query_vector = await self._semantic_lookup(semantic_key, query, request)
+        if cached_aspects is not None:
+            return list(cached_aspects)
+        
         try:
-            # Create system message for outline generation
-            system_message = f"""You are a research planning specialist. Generate {breadth} specific research aspects for comprehensive analysis of: {query}
-
-Create focused research areas that are:
-- Specific and actionable
-- Comprehensive and covering different dimensions
-- Relevant to the topic
-- Suitable for detailed investigation
-
-Format your response as a numbered list of research aspects, each on a new line.
-Example format:
-1. [Specific research aspect]
-2. [Another specific research aspect]
-etc.
-
-Focus on practical, investigatable aspects that would provide valuable insights."""
-            
             # Make OpenAI API call
-            response = await self.client.chat.completions.create(
-                model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": f"Generate {breadth} specific research aspects for comprehensive analysis of: {query}"}
-                ],
-                temperature=0.7,
-                max_tokens=1000
+            response = await cached_completion(
+                self.client, RESEARCH_CACHE, self.llm_semaphore, RATE_LIMITER, **request, stream=True
             )
             
             # Extract the response content
             outline_content = response.choices[0].message.content
             
             # Parse the numbered list into individual aspects
-            aspects = []
-            lines = outline_content.strip().split('\n')
-            for line in lines:
-                line = line.strip()
-                if line and (line[0].isdigit() or line.startswith('-') or line.startswith('•')):
-                    # Remove numbering and clean up the aspect
-                    aspect = line.split('.', 1)[-1].strip() if '.' in line else line.lstrip('-•').strip()
-                    if aspect:
-                        aspects.append(aspect)
+            aspects = ASPECT_LINE_PATTERN.findall(outline_content)
             
             # Ensure we have the requested number of aspects
             if len(aspects) < breadth:
                 # Fallback to generic aspects if parsing failed
-                generic_aspects = [
-                    f"Current state and overview of {query}",
-                    f"Recent developments and trends in {query}",
-                    f"Key challenges and opportunities in {query}",
-                    f"Future implications and predictions for {query}",
-                    f"Expert opinions and analysis on {query}",
-                    f"Technical aspects and specifications of {query}",
-                    f"Economic and market impact of {query}",
-                    f"Social and cultural effects of {query}",
-                    f"Regulatory and legal considerations for {query}",
-                    f"Comparative analysis and alternatives to {query}"
-                ]
-                aspects.extend(generic_aspects[len(aspects):breadth])
+                aspects.extend(self._fallback_aspects(query, breadth, start=len(aspects)))
             
-            return aspects[:breadth]
+            aspects = aspects[:breadth]
+            self._semantic_store(semantic_key, query_vector, aspects)
+            return aspects
             
-        except Exception as e:
-            logger.error(f"Error generating research outline: {e}")
+        except Exception:
+            logger.exception("Error generating research outline")
             # Fallback to generic aspects
-            aspects = [
-                f"Current state and overview of {query}",
-                f"Recent developments and trends in {query}",
-                f"Key challenges and opportunities in {query}",
-                f"Future implications and predictions for {query}",
-                f"Expert opinions and analysis on {query}",
-                f"Technical aspects and specifications of {query}",
-                f"Economic and market impact of {query}",
-                f"Social and cultural effects of {query}",
-                f"Regulatory and legal considerations for {query}",
-                f"Comparative analysis and alternatives to {query}"
-            ]
-            return aspects[:breadth]
+            return self._fallback_aspects(query, breadth)
 
-    async def _perform_iterative_research(self, query: str, outline: List[str], depth: int) -> Dict[str, List[str]]:
-        """Perform iterative research on each aspect"""
+    @staticmethod
+    def _fallback_aspects(query: str, breadth: int, start: int = 0) -> List[str]:
+        """Format the generic aspects from position start up to breadth, for when the outline falls short"""
         
-        research_results = {}
+        return [template.format(query=query) for template in GENERIC_ASPECT_TEMPLATES[start:breadth]]
+
+    def _perform_iterative_research(self, query: str, outline: List[str], depth: int) -> List["asyncio.Task[List[str]]"]:
+        """Start iterative research on every aspect concurrently, returning one task per aspect"""
         
-        for aspect in outline:
-            research_results[aspect] = []
-            
-            # Perform multiple iterations of research
-            for iteration in range(depth):
-                # Get research findings for this aspect and iteration
-                findings = await self._research_aspect(aspect, iteration + 1)
-                research_results[aspect].extend(findings)
-                
-                # Add some delay to simulate research time
-                await asyncio.sleep(0.1)
+        return [asyncio.create_task(self._research_aspect(aspect, depth)) for aspect in outline]
+
+    def _perform_batch_research(self, outline: List[str], depth: int) -> List["asyncio.Task[List[str]]"]:
+        """Start research on every aspect as one Batch API job, returning one task per aspect"""
+        
+        batch_task = asyncio.create_task(self._research_aspects_batch(outline, depth))
+        
+        async def aspect_findings(index: int) -> List[str]:
+            return (await batch_task)[index]
         
-        return research_results
+        return [asyncio.create_task(aspect_findings(index)) for index in range(len(outline))]
 
-    async def _research_aspect(self, aspect: str, iteration: int) -> List[str]:
-        """Perform actual AI-powered research for a specific aspect"""
+    async def _research_aspect(self, aspect: str, depth: int) -> List[str]:
+        """Perform actual AI-powered research for a specific aspect, covering all iterations in one request"""
+        
+        request = self._aspect_request(aspect, depth)
+        
+        semantic_key = ("research_aspect", depth)
+        cached_findings, aspect_vector = await self._semantic_lookup(semantic_key, aspect, request)
+        if cached_findings is not None:
+            return list(cached_findings)
         
         try:
-            # Create system message for research
-            system_message = f"""You are a specialized research analyst conducting iteration {iteration} research on: {aspect}
-
-Provide a detailed, factual analysis focusing on:
-- Current state and recent developments
-- Key facts, statistics, and data points
-- Important trends and patterns
-- Challenges and opportunities
-- Expert insights and analysis
-- Future implications
-
-Format your response as clear, actionable bullet points with specific details.
-Be thorough, factual, and provide valuable insights that go beyond general statements.
-Focus on concrete information and actionable intelligence."""
-            
-            # Make OpenAI API call
-            response = await self.client.chat.completions.create(
-                model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": f"Research and analyze: {aspect}. Provide detailed findings for iteration {iteration}."}
-                ],
-                temperature=0.7,
-                max_tokens=1500
+            # Make a streamed OpenAI API call, sampling one independent analysis per iteration (n=depth)
+            response = await cached_completion(
+                self.client, RESEARCH_CACHE, self.llm_semaphore, RATE_LIMITER, **request, stream=True
             )
             
-            # Extract the content from the response
-            research_content = response.choices[0].message.content
-            
-            # Format the findings as a list
-            findings = [
-                f"Research iteration {iteration} for {aspect}:",
-                research_content.strip()
-            ]
-            
+            findings = self._format_findings(aspect, response)
+            self._semantic_store(semantic_key, aspect_vector, findings)
             return findings
             
         except Exception as e:
-            logger.error(f"Error in _research_aspect: {e}")
-            # Fallback to indicate the error
-            return [
-                f"Research iteration {iteration} for {aspect}:",
-                f"❌ Error occurred during research: {str(e)}",
-                "Please check your Azure OpenAI configuration and try again."
-            ]
+            logger.exception("Error in _research_aspect")
+            return self._error_findings(aspect, e)
+
+    async def _research_aspects_batch(self, outline: List[str], depth: int) -> List[List[str]]:
+        """Research every aspect through one Batch API job, returning the findings in outline order"""
+        
+        requests = [self._aspect_request(aspect, depth) for aspect in outline]
+        
+        try:
+            # Later online requests for the same aspects are served from the cache
+            responses = await run_chat_completion_batch(self.client, requests, cache=RESEARCH_CACHE)
+        except Exception as e:
+            logger.exception("Error in _research_aspects_batch")
+            return [self._error_findings(aspect, e) for aspect in outline]
+        
+        results = []
+        for aspect, response in zip(outline, responses):
+            if response is None:
+                results.append(self._error_findings(aspect, "the batch request failed"))
+                continue
+            try:
+                results.append(self._format_findings(aspect, response))
+            except Exception as e:
+                # One unusable response (e.g. filtered content) only fails its own aspect
+                logger.exception("Error formatting batch findings for %s", aspect)
+                results.append(self._error_findings(aspect, e))
+        
+        return results
 
-    async def _generate_final_report(self, query: str, research_results: Dict[str, List[str]], breadth: int, depth: int) -> str:
-        """Generate a comprehensive final research report"""
+    @staticmethod
+    def _aspect_request(aspect: str, depth: int) -> Dict[str, Any]:
+        """Build the chat completion request for one aspect, sampling one analysis per iteration (n=depth)"""
         
-        current_date = datetime.datetime.now().strftime("%Y-%m-%d")
+        return {
+            "model": AZURE_OPENAI_CONFIG.deployment,
+            "messages": [
+                {"role": "system", "content": RESEARCH_SYSTEM_MESSAGE},
+                {"role": "user", "content": f"Research and analyze: {aspect}. Provide detailed findings."}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 1500,
+            "n": depth
+        }
+
+    @staticmethod
+    def _format_findings(aspect: str, response: ChatCompletion) -> List[str]:
+        """Format the findings of each iteration as a list"""
+        
+        findings = []
+        for iteration, choice in enumerate(sorted(response.choices, key=lambda c: c.index), 1):
+            findings.append(f"Research iteration {iteration} for {aspect}:")
+            findings.append(choice.message.content.strip())
+        return findings
+
+    @staticmethod
+    def _error_findings(aspect: str, error: Any) -> List[str]:
+        """Fallback findings indicating that research on an aspect failed"""
         
-        report = f"""# Deep Research Report: {query}
+        return [
+            f"Research for {aspect}:",
+            f"❌ Error occurred during research: {str(error)}",
+            "Please check your Azure OpenAI configuration and try again."
+        ]
+
+    async def _semantic_lookup(self, namespace: Hashable, text: str,
+                               request: Dict[str, Any]) -> Tuple[Optional[Any], Optional[Any]]:
+        """
+        Look up text in the semantic cache, returning the cached value (or None) and its embedding
+        
+        The embedding round trip is skipped when the exact-match cache already
+        holds the request's response or an identical request is in flight.
+        """
+        if not SEMANTIC_CACHE_ENABLED or has_response(RESEARCH_CACHE, **request):
+            return None, None
+        
+        try:
+            vector = await SEMANTIC_RESEARCH_CACHE.embed(self.client, text, self.llm_semaphore)
+        except Exception:
+            logger.exception("Error embedding text for the semantic cache")
+            return None, None
+        
+        return SEMANTIC_RESEARCH_CACHE.lookup(namespace, vector), vector
+
+    def _semantic_store(self, namespace: Hashable, vector: Optional[Any], value: List[str]) -> None:
+        """Store a result in the semantic cache under the embedding returned by _semantic_lookup"""
+        
+        if vector is not None:
+            SEMANTIC_RESEARCH_CACHE.add(namespace, vector, list(value))
+
+    async def _generate_final_report(self, query: str, outline: List[str], research_tasks: List["asyncio.Task[List[str]]"],
+                                     breadth: int, depth: int) -> AsyncIterator[str]:
+        """Generate a comprehensive final research report, yielding each section once its findings are ready"""
+        
+        current_date = datetime.date.today().isoformat()
+        
+        yield f"""# Deep Research Report: {query}
 
 **Research Date:** {current_date}  
 **Research Scope:** {breadth} aspects explored with {depth} iterations each  
-**Total Research Points:** {len(research_results) * depth}
+**Total Research Iterations:** {len(outline) * depth}
 
 ## Executive Summary
 
@@ -265,20 +418,16 @@ This comprehensive research report presents findings from a multi-dimensional an
 
 """
         
-        # Add detailed findings for each aspect
-        for i, (aspect, findings) in enumerate(research_results.items(), 1):
-            report += f"### {i}. {aspect}\n\n"
-            
-            for finding in findings:
-                report += f"{finding}\n\n"
-            
-            report += "---\n\n"
+        # Add detailed findings for each aspect, in outline order
+        for i, (aspect, task) in enumerate(zip(outline, research_tasks), 1):
+            findings = "\n\n".join(await task)
+            yield f"### {i}. {aspect}\n\n{findings}\n\n---\n\n"
 
         # Add methodology notes
-        report += f"""## Sources and Methodology Notes
+        yield f"""## Sources and Methodology Notes
 
 - Research conducted using systematic multi-aspect analysis
-- Findings synthesized from {len(research_results)} research areas
+- Findings synthesized from {len(outline)} research areas
 - Each area investigated through {depth} iterative research cycles
 - Report generated on {current_date}
 
@@ -287,8 +436,6 @@ This comprehensive research report presents findings from a multi-dimensional an
 *This report was generated using the Deep Research Plugin for comprehensive topic analysis.*
 """
 
-        return report
-
 
 # Function definitions for OpenAI function calling
 def get_research_functions():
@@ -345,6 +492,10 @@ def get_research_functions():
     ]
 
 
+# Built once; every chat turn sends the same tool definitions
+RESEARCH_TOOLS = get_research_functions()
+
+
 # Helper class for creating deep research agent using OpenAI
 class DeepResearchAgent:
     """
@@ -353,29 +504,13 @@ class DeepResearchAgent:
     
     def __init__(self):
         """Initialize the deep research agent with OpenAI client"""
-        self._credential = AzureCliCredential()
-        self.client = openai.AsyncAzureOpenAI(
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            azure_ad_token_provider=lambda: self._credential.get_token("https://cognitiveservices.azure.com/.default").token,
-            api_version="2024-02-01"
-        )
+        self.client = get_async_client()
         self.plugin = DeepResearchPlugin()
-        self.system_message = """You are an expert deep research agent capable of performing comprehensive, multi-level research on any topic.
-
-You have access to research functions that can help you provide detailed analysis. When a user asks you to research something, you should:
-
-1. Use the appropriate research function (deep_research for comprehensive analysis, quick_research for faster results)
-2. Provide detailed, factual analysis focusing on:
-   - Current state and recent developments
-   - Key facts, statistics, and data points
-   - Important trends and patterns
-   - Challenges and opportunities
-   - Expert insights and analysis
-   - Future implications
-
-Always provide well-structured, detailed reports with clear insights.
-Be thorough, factual, and provide valuable analysis that goes beyond surface-level information.
-Your research should be comprehensive, well-organized, and actionable."""
+        self.tool_functions = {
+            "deep_research": self.plugin.deep_research,
+            "quick_research": self.plugin.quick_research,
+        }
+        self.system_message = AGENT_SYSTEM_MESSAGE
 
     async def chat(self, message: str) -> str:
         """
@@ -394,13 +529,15 @@ Your research should be comprehensive, well-organized, and actionable."""
             ]
             
             # First call to potentially trigger function calling
-            response = await self.client.chat.completions.create(
-                model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+            response = await cached_completion(
+                self.client, RESEARCH_CACHE, self.plugin.llm_semaphore, RATE_LIMITER,
+                model=AZURE_OPENAI_CONFIG.deployment,
                 messages=messages,
-                tools=get_research_functions(),
+                tools=RESEARCH_TOOLS,
                 tool_choice="auto",
                 temperature=0.7,
-                max_tokens=2000
+                max_tokens=2000,
+                stream=True
             )
             
             response_message = response.choices[0].message
@@ -414,38 +551,28 @@ Your research should be comprehensive, well-organized, and actionable."""
                     "tool_calls": response_message.tool_calls
                 })
                 
-                # Execute each function call
-                for tool_call in response_message.tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-                    
-                    # Call the appropriate function
-                    if function_name == "deep_research":
-                        function_response = await self.plugin.deep_research(
-                            query=function_args.get("query"),
-                            breadth=function_args.get("breadth", 3),
-                            depth=function_args.get("depth", 2)
-                        )
-                    elif function_name == "quick_research":
-                        function_response = await self.plugin.quick_research(
-                            query=function_args.get("query")
-                        )
-                    else:
-                        function_response = f"Unknown function: {function_name}"
-                    
-                    # Add function response to messages
+                # Execute all function calls concurrently, keeping their original order
+                results = await asyncio.gather(
+                    *(dispatch_tool_call(tool_call, self.tool_functions, RESEARCH_TOOLS)
+                      for tool_call in response_message.tool_calls)
+                )
+                
+                # Add function responses to messages
+                for tool_call_id, function_response in results:
                     messages.append({
                         "role": "tool",
-                        "tool_call_id": tool_call.id,
+                        "tool_call_id": tool_call_id,
                         "content": function_response
                     })
                 
-                # Get final response from the model
-                final_response = await self.client.chat.completions.create(
-                    model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+                # Get final response from the model, streamed so the read timeout applies per chunk
+                final_response = await cached_completion(
+                    self.client, RESEARCH_CACHE, self.plugin.llm_semaphore, RATE_LIMITER,
+                    model=AZURE_OPENAI_CONFIG.deployment,
                     messages=messages,
                     temperature=0.7,
-                    max_tokens=2000
+                    max_tokens=2000,
+                    stream=True
                 )
                 
                 return final_response.choices[0].message.content
@@ -454,7 +581,7 @@ Your research should be comprehensive, well-organized, and actionable."""
                 return response_message.content
             
         except Exception as e:
-            logger.error(f"Error in chat: {e}")
+            logger.exception("Error in chat")
             return f"❌ Chat failed: {str(e)}"
 
 
@@ -6,7 +6,9 @@ This demonstrates the basic usage patterns for the refactored plugin.
 """
 
 import asyncio
+import logging
 import os
+from azure_openai_client import close_async_client
 from deep_research_plugin import DeepResearchPlugin, create_deep_research_agent
 
 
@@ -55,7 +57,11 @@ async def main():
         
     except Exception as e:
         print(f"❌ Error: {e}")
+    finally:
+        # Release the shared Azure OpenAI connections
+        await close_async_client()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,368 @@
+"""
+LLM Cache Module
+
+This module contains the response cache used to skip repeated Azure OpenAI
+calls for requests that have already been answered, optionally persisted to
+a SQLite file so cached responses survive restarts, and a semantic cache
+that also reuses results for inputs that are worded differently but mean
+the same thing.
+"""
+
+import os
+import time
+import asyncio
+import json
+import sqlite3
+import hashlib
+import contextlib
+import unicodedata
+from collections import OrderedDict
+from typing import Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from openai.types.chat import ChatCompletion
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# SQLite file used to persist cached responses; unset keeps the cache in memory only
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH") or None
+
+# Whether results are also reused for semantically similar (not just identical) inputs
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Request fields that do not change the model's answer and are left out of the cache key
+_UNCACHED_REQUEST_FIELDS = frozenset({"stream", "stream_options", "user", "timeout", "extra_headers"})
+
+# Requests currently in flight, keyed by hash_request(), so identical concurrent requests share one call
+_inflight: Dict[str, "asyncio.Task[Any]"] = {}
+
+# Number of callers awaiting each in-flight task, so it can be cancelled once nobody waits for it
+_waiters: Dict["asyncio.Task[Any]", int] = {}
+
+
+def _to_jsonable(value: Any) -> Any:
+    """Convert SDK objects (e.g. tool calls echoed back in messages) for JSON serialization"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    return str(value)
+
+
+def hash_request(**request: Any) -> str:
+    """Hash the keyword arguments of a chat completion request into a stable SHA-256 cache key"""
+    relevant = {name: value for name, value in request.items() if name not in _UNCACHED_REQUEST_FIELDS}
+    serialized = json.dumps(relevant, sort_keys=True, ensure_ascii=False, default=_to_jsonable)
+    return hashlib.sha256(unicodedata.normalize("NFC", serialized).encode("utf-8")).hexdigest()
+
+
+def estimate_request_tokens(**request: Any) -> int:
+    """Roughly estimate the tokens a chat completion request counts against a tokens-per-minute limit"""
+    # About four characters per prompt token; Azure reserves max_tokens for every choice up front
+    prompt = json.dumps([request.get("messages"), request.get("tools")], ensure_ascii=False, default=_to_jsonable)
+    return len(prompt) // 4 + (request.get("max_tokens") or 0) * (request.get("n") or 1)
+
+
+class ResponseCache:
+    """An LRU cache with an optional time-to-live and optional SQLite persistence
+
+    All operations are synchronous and run on the event loop thread, so
+    concurrent coroutines can share one instance without extra locking.
+    Persisted values must be JSON-serializable.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: Optional[float] = None, path: Optional[str] = None):
+        """
+        Initialize the cache
+
+        Args:
+            maxsize: Maximum number of entries kept in memory before evicting the least recently used
+            ttl: Seconds an entry stays valid, or None to keep entries until evicted
+            path: SQLite file to persist entries to, or None to keep them in memory only
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0}
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, stored_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None and self._db is not None:
+            row = self._db.execute("SELECT stored_at, value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                entry = (row[0], json.loads(row[1]))
+
+        if entry is not None:
+            stored_at, value = entry
+            if self.ttl is None or time.time() - stored_at <= self.ttl:
+                self._remember(key, stored_at, value)
+                self.stats["hits"] += 1
+                return value
+            self._entries.pop(key, None)
+
+        self.stats["misses"] += 1
+        return None
+
+    def __contains__(self, key: str) -> bool:
+        """Whether a valid entry exists for key; unlike get(), this doesn't count as a hit or miss"""
+        entry = self._entries.get(key)
+        if entry is None and self._db is not None:
+            row = self._db.execute("SELECT stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                entry = (row[0], None)
+        return entry is not None and (self.ttl is None or time.time() - entry[0] <= self.ttl)
+
+    def set(self, key: str, value: Any) -> None:
+        """Store value under key, evicting the least recently used entries if needed"""
+        stored_at = time.time()
+        self._remember(key, stored_at, value)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, stored_at, value) VALUES (?, ?, ?)",
+                (key, stored_at, json.dumps(value, ensure_ascii=False))
+            )
+            self._db.commit()
+
+    def clear(self) -> None:
+        """Remove all cached entries, including persisted ones"""
+        self._entries.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def _remember(self, key: str, stored_at: float, value: Any) -> None:
+        """Keep an entry in memory as the most recently used one"""
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def has_response(cache: ResponseCache, **request: Any) -> bool:
+    """Whether cached_completion can answer a request without a new API call, because it is cached or in flight"""
+    key = hash_request(**request)
+    return key in _inflight or key in cache
+
+
+async def coalesced(key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Await factory() at most once at a time per key; concurrent callers with the same key share its result
+
+    The shared call runs as its own task, so one caller being cancelled does
+    not cancel it for the others; it is cancelled once its last caller is.
+
+    Args:
+        key: Identifies equivalent calls, e.g. a hash_request() cache key
+        factory: Creates the awaitable to run when no call for key is in flight
+
+    Returns:
+        The result of the in-flight or newly started call
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+
+    _waiters[task] = _waiters.get(task, 0) + 1
+    try:
+        return await asyncio.shield(task)
+    finally:
+        _waiters[task] -= 1
+        if not _waiters[task]:
+            del _waiters[task]
+            # Nobody is left to use the result, so stop the call (a no-op if it has finished)
+            task.cancel()
+
+
+def assemble_stream(chunks: List[Any]) -> ChatCompletion:
+    """Assemble the chunks of a streamed chat completion into the equivalent ChatCompletion"""
+    completion = {"id": "", "object": "chat.completion", "created": 0, "model": ""}
+    choices: Dict[int, Dict[str, Any]] = {}
+
+    for chunk in chunks:
+        completion.update(id=chunk.id, created=chunk.created, model=chunk.model)
+        for chunk_choice in chunk.choices:
+            choice = choices.setdefault(
+                chunk_choice.index, {"content": [], "tool_calls": {}, "finish_reason": "stop"}
+            )
+            delta = chunk_choice.delta
+            if delta.content:
+                choice["content"].append(delta.content)
+            for tool_call_delta in delta.tool_calls or ():
+                tool_call = choice["tool_calls"].setdefault(
+                    tool_call_delta.index, {"id": "", "type": "function", "function": {"name": "", "arguments": ""}}
+                )
+                if tool_call_delta.id:
+                    tool_call["id"] = tool_call_delta.id
+                if tool_call_delta.function:
+                    tool_call["function"]["name"] += tool_call_delta.function.name or ""
+                    tool_call["function"]["arguments"] += tool_call_delta.function.arguments or ""
+            if chunk_choice.finish_reason:
+                choice["finish_reason"] = chunk_choice.finish_reason
+
+    completion["choices"] = [
+        {
+            "index": index,
+            "finish_reason": choice["finish_reason"],
+            "message": {
+                "role": "assistant",
+                "content": "".join(choice["content"]) or None,
+                "tool_calls": [choice["tool_calls"][i] for i in sorted(choice["tool_calls"])] or None,
+            },
+        }
+        for index, choice in sorted(choices.items())
+    ]
+    return ChatCompletion.model_validate(completion)
+
+
+async def cached_completion(client: Any, cache: ResponseCache, limiter: Optional[AsyncContextManager] = None,
+                            rate_limiter: Optional[Any] = None, on_chunk: Optional[Callable[[Any], None]] = None,
+                            **request: Any) -> ChatCompletion:
+    """
+    Create a chat completion, serving repeated identical requests from the cache
+
+    Identical requests that arrive while one is still in flight wait for it
+    instead of calling the API again. A request with stream=True is consumed
+    incrementally and still returns one assembled ChatCompletion, sharing
+    cache entries with the same request made without streaming.
+
+    Args:
+        client: The AsyncAzureOpenAI client used on a cache miss
+        cache: Cache holding previous responses keyed by hash_request()
+        limiter: Optional async context manager (e.g. a semaphore) held only around the API call
+        rate_limiter: Optional token bucket whose acquire(tokens) is awaited right before the API call
+        on_chunk: Optional callback for each streamed chunk, called only when this call makes the API request
+        **request: Keyword arguments for chat.completions.create
+
+    Returns:
+        The cached or freshly created chat completion
+    """
+    key = hash_request(**request)
+    cached = cache.get(key)
+    if cached is not None:
+        return ChatCompletion.model_validate(cached)
+
+    async def create() -> ChatCompletion:
+        async with limiter or contextlib.nullcontext():
+            if rate_limiter is not None:
+                await rate_limiter.acquire(estimate_request_tokens(**request))
+            response = await client.chat.completions.create(**request)
+            if request.get("stream"):
+                chunks = []
+                async for chunk in response:
+                    chunks.append(chunk)
+                    if on_chunk is not None:
+                        on_chunk(chunk)
+                response = assemble_stream(chunks)
+        cache.set(key, response.model_dump(mode="json"))
+        return response
+
+    return await coalesced(key, create)
+
+
+async def cached_completion_stream(client: Any, cache: ResponseCache, limiter: Optional[AsyncContextManager] = None,
+                                   rate_limiter: Optional[Any] = None, **request: Any) -> AsyncIterator[str]:
+    """
+    Stream the content of a chat completion's first choice, serving repeated identical requests from the cache
+
+    On a cache hit the whole cached content is yielded at once. On a miss
+    each content delta is yielded as it arrives, and the assembled response
+    is cached once the stream completes. Unlike cached_completion, in-flight
+    requests are not coalesced, since each caller consumes its own stream.
+
+    Args:
+        client: The AsyncAzureOpenAI client used on a cache miss
+        cache: Cache holding previous responses keyed by hash_request()
+        limiter: Optional async context manager (e.g. a semaphore) held while the response streams
+        rate_limiter: Optional token bucket whose acquire(tokens) is awaited right before the API call
+        **request: Keyword arguments for chat.completions.create, without stream
+
+    Yields:
+        Consecutive pieces of the response content
+    """
+    key = hash_request(**request)
+    cached = cache.get(key)
+    if cached is not None:
+        yield ChatCompletion.model_validate(cached).choices[0].message.content or ""
+        return
+
+    chunks = []
+    async with limiter or contextlib.nullcontext():
+        if rate_limiter is not None:
+            await rate_limiter.acquire(estimate_request_tokens(**request))
+        stream = await client.chat.completions.create(**request, stream=True)
+        async for chunk in stream:
+            chunks.append(chunk)
+            for choice in chunk.choices:
+                if choice.index == 0 and choice.delta.content:
+                    yield choice.delta.content
+
+    cache.set(key, assemble_stream(chunks).model_dump(mode="json"))
+
+
+class SemanticCache:
+    """A cache that matches inputs by embedding cosine similarity instead of exact equality
+
+    Entries are grouped into namespaces (e.g. the kind of call and its
+    parameters) so only comparable results can match. Each namespace keeps
+    its unit-normalized embeddings in one matrix, so a lookup is a single
+    matrix-vector product. The oldest entries are evicted first.
+    """
+
+    def __init__(self, deployment: Optional[str], threshold: float = 0.93, maxsize: int = 2048):
+        """
+        Initialize the cache
+
+        Args:
+            deployment: Azure OpenAI embeddings deployment used to embed inputs
+            threshold: Minimum cosine similarity for a cached entry to count as a hit
+            maxsize: Maximum number of entries kept per namespace
+        """
+        self.deployment = deployment
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.stats = {"hits": 0, "misses": 0}
+        self._indexes: Dict[Hashable, Tuple[np.ndarray, List[Any]]] = {}
+
+    async def embed(self, client: Any, text: str, limiter: Optional[AsyncContextManager] = None) -> np.ndarray:
+        """Embed text with the configured deployment and return it as a unit vector"""
+        async with limiter or contextlib.nullcontext():
+            response = await client.embeddings.create(model=self.deployment, input=text)
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def lookup(self, namespace: Hashable, vector: np.ndarray) -> Optional[Any]:
+        """Return the value of the most similar entry in namespace, or None if none is similar enough"""
+        index = self._indexes.get(namespace)
+        if index is not None:
+            matrix, values = index
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                self.stats["hits"] += 1
+                return values[best]
+        self.stats["misses"] += 1
+        return None
+
+    def add(self, namespace: Hashable, vector: np.ndarray, value: Any) -> None:
+        """Store value under the given embedding, evicting the oldest entries of the namespace if needed"""
+        matrix, values = self._indexes.get(namespace, (np.empty((0, vector.shape[0]), dtype=np.float32), []))
+        matrix = np.vstack([matrix, vector])[-self.maxsize:]
+        values = (values + [value])[-self.maxsize:]
+        self._indexes[namespace] = (matrix, values)
+
+    def clear(self) -> None:
+        """Remove all cached entries"""
+        self._indexes.clear()
@@ -9,11 +9,14 @@ comprehensive risk assessment analysis using AI agents.
 import os
 import re
 import asyncio
+import logging
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 
 # Import the agent functionality from the separate modules
+from azure_openai_client import close_async_client
 from deep_research_plugin import DeepResearchPlugin, create_deep_research_agent
 from risk_agent import RiskAssessmentPlugin, create_risk_assessment_agent
 
@@ -38,6 +41,9 @@ async def main():
     print("• 'Industrial facility in Houston, Texas'")
     print("=" * 65)
     
+    # Fetch the Azure AD token and connect now rather than during the first analysis
+    await create_deep_research_plugin().warmup()
+    
     # Interactive mode - keep asking for input until user exits
     while True:
         try:
@@ -61,6 +67,9 @@ async def main():
         except Exception as e:
             print(f"❌ Application error: {e}")
             print("Please try again or type 'exit' to quit.")
+    
+    # Release the shared Azure OpenAI connections
+    await close_async_client()
 
 
 def sanitize_filename(filename: str) -> str:
@@ -148,23 +157,35 @@ async def process_location_risk_assessment(location_input: str):
         print("-" * 50)
         
         deep_research_plugin = create_deep_research_plugin()
-        research_result = await deep_research_plugin.deep_research(location_input)
+        
+        # Print each report section as soon as it is ready
+        print("📋 Research Results:")
+        research_sections = []
+        async for section in deep_research_plugin.deep_research_stream(location_input):
+            print(section, end="", flush=True)
+            research_sections.append(section)
+        research_result = "".join(research_sections)
         
         print("✅ Research Complete!")
-        print(f"📋 Research Results:\n{research_result}")
         
         # Stage 2: Risk Assessment
         print("\n🚨 Stage 2: Risk Assessment Analysis")
         print("-" * 50)
         
         risk_plugin = create_risk_assessment_plugin()
-        risk_assessment = await risk_plugin.assess_risks(
+        
+        # Print the risk analysis as it is generated
+        print("⚠️ Risk Analysis:")
+        risk_parts = []
+        async for part in risk_plugin.assess_risks_stream(
             research_data=f"Location: {location_input}\n\nResearch Data:\n{research_result}",
             location=location_input
-        )
+        ):
+            print(part, end="", flush=True)
+            risk_parts.append(part)
+        risk_assessment = "".join(risk_parts).strip()
         
-        print("✅ Risk Assessment Complete!")
-        print(f"⚠️ Risk Analysis:\n{risk_assessment}")
+        print("\n✅ Risk Assessment Complete!")
       
         print("✅ Analysis Complete!")
         
@@ -188,20 +209,23 @@ async def process_location_risk_assessment(location_input: str):
         print("Please try again with a different location or check your input.")
 
 
+@lru_cache(maxsize=1)
 def create_deep_research_plugin():
-    """Create and return a Deep Research plugin instance"""
+    """Create the Deep Research plugin once and reuse it for every location"""
     from deep_research_plugin import DeepResearchPlugin
     return DeepResearchPlugin()
 
 
+@lru_cache(maxsize=1)
 def create_risk_assessment_plugin():
-    """Create and return a Risk Assessment plugin instance"""
+    """Create the Risk Assessment plugin once and reuse it for every location"""
     from risk_agent import RiskAssessmentPlugin
     return RiskAssessmentPlugin()
 
 
 def run_application():
     """Entry point for running the application"""
+    logging.basicConfig(level=logging.INFO)
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -6,36 +6,126 @@ for performing comprehensive risk analysis on locations, buildings, and assets.
 Uses OpenAI Azure API with function calling.
 """
 
-import os
-import json
+import re
+import asyncio
 import logging
-from typing import Dict, Any
-import openai
-from azure.identity import AzureCliCredential
+from typing import Any, AsyncIterator, Dict, List, Tuple
 from dotenv import load_dotenv
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+from azure_openai_client import (
+    AZURE_OPENAI_CONFIG, LLM_SEMAPHORE, RATE_LIMITER, dispatch_tool_call, get_async_client, json_loads,
+    run_chat_completion_batch
+)
+from llm_cache import (
+    LLM_CACHE_PATH, SEMANTIC_CACHE_ENABLED, ResponseCache, SemanticCache, cached_completion, cached_completion_stream,
+    has_response
+)
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Identical assessment requests are answered from this cache for an hour
+ASSESSMENT_CACHE = ResponseCache(maxsize=512, ttl=3600, path=LLM_CACHE_PATH)
+
+# Assessments are also reused for near-duplicate research data (reformatted, reordered or reworded)
+SEMANTIC_ASSESSMENT_CACHE = SemanticCache(AZURE_OPENAI_CONFIG.embedding_deployment, threshold=0.92, maxsize=2048)
+
+# Characters of location and research data embedded for the semantic cache lookup
+SEMANTIC_CACHE_INPUT_CHARS = 8192
+
+# Fixed system prompts; location and research data only ever go into the user message
+ASSESSMENT_SYSTEM_MESSAGE = """You are an expert risk assessment analyst. Analyze the provided research data and perform a comprehensive risk assessment.
+
+Evaluate risks across these categories:
+- Structural & Engineering Risks
+- Environmental & Natural Disaster Risks
+- Safety & Security Risks
+- Financial & Economic Risks
+- Regulatory & Legal Risks
+- Operational & Business Risks
+
+For each relevant risk category, provide:
+- Risk Level: Critical/High/Medium/Low
+- Likelihood: Probability of occurrence
+- Impact: Potential consequences
+- Evidence: Supporting data from research
+- Key Concerns: Specific issues identified
+
+Format your response with clear headings and bullet points. Be specific and actionable based on the research data provided.
+Keep the entire response under 400 words. One line per bullet. Omit filler intros and conclusions."""
+
+AGENT_SYSTEM_MESSAGE = """You are an expert risk assessment analyst with deep expertise in evaluating various types of risks for locations, buildings, and assets. Your role is to provide comprehensive, actionable risk assessments based on research data.
+
+You have access to risk assessment functions that can help you analyze locations and buildings. When a user asks for risk assessment, you should:
+
+1. Use the assess_risks function to perform comprehensive analysis
+2. Provide detailed risk analysis covering:
+   - Structural & Engineering Risks
+   - Environmental & Natural Disaster Risks
+   - Safety & Security Risks
+   - Financial & Economic Risks
+   - Regulatory & Legal Risks
+   - Operational & Business Risks
+
+Always provide professional, thorough, and actionable risk assessments that help users make informed decisions about locations, buildings, and assets.
+Keep the entire response under 400 words. One line per bullet. Omit filler intros and conclusions."""
+
+# Default cap on generated tokens; output length dominates response time
+DEFAULT_MAX_TOKENS = 800
+
+# Research data beyond this many characters (about 12k tokens) is elided from the middle of the prompt.
+# A default deep research report (3 aspects, depth 2) stays below it.
+MAX_RESEARCH_DATA_CHARS = 48000
+
+# Fixed seed for the tool-selection call, so repeated questions route the same way and hit the cache
+ROUTE_SEED = 42
+
+# Requests that plainly ask for a risk assessment of one named location, e.g.
+# "Perform a risk assessment for Pier 39, San Francisco" or "Assess the risks of the Empire State Building";
+# any research data may follow on later lines. Only qualifiers that don't narrow the focus are accepted,
+# so e.g. "a flood risk assessment" is left to the model to turn into risk_categories.
+DIRECT_ASSESSMENT_PATTERN = re.compile(
+    r"\A\s*(?:please\s+)?"
+    r"(?:(?:perform|run|do|give\s+me|provide)\s+(?:an?\s+)?"
+    r"(?:(?:comprehensive|full|complete|detailed|thorough|general|overall|quick)\s+)?risk\s+assessment"
+    r"|risk\s+assessment"
+    r"|assess\s+(?:the\s+)?risks?)"
+    r"\s+(?:for|of|on|at)\s+(?P<location>[^\n]{2,150}?)[ \t]*[.!?:]?[ \t]*(?:\n|\Z)",
+    re.IGNORECASE
+)
+
+# Location phrases that likely name several places, which the model should split into separate tool calls
+MULTIPLE_LOCATIONS_PATTERN = re.compile(r"\s(?:and|vs\.?|versus)\s|;|&", re.IGNORECASE)
+
+# Location phrases that run on into another sentence, e.g. "Denver, CO. Include a summary table"
+FOLLOW_UP_SENTENCE_PATTERN = re.compile(r"[.!?]\s+\S")
+
+# Location phrases that carry a focus or condition, which the model should turn into risk_categories
+FOCUS_CLAUSE_PATTERN = re.compile(
+    r"\b(?:focus(?:ing|ed)?|emphasi[sz]ing|with\s+(?:an?\s+)?(?:emphasis|focus)|regarding|including|especially"
+    r"|particularly|considering|concerning|with\s+respect\s+to|in\s+terms\s+of|if|when|assuming|given)\b",
+    re.IGNORECASE
+)
+
 
 class RiskAssessmentPlugin:
     """An OpenAI-based plugin to perform comprehensive risk assessment analysis"""
     
-    def __init__(self):
-        """Initialize the Risk Assessment Plugin"""
-        self.logger = logging.getLogger(__name__)
-        self.logger.debug("Risk Assessment Plugin initialized")
+    def __init__(self, max_tokens: int = DEFAULT_MAX_TOKENS):
+        """
+        Initialize the Risk Assessment Plugin
         
-        # Initialize OpenAI client
-        self._credential = AzureCliCredential()
-        self.client = openai.AsyncAzureOpenAI(
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            azure_ad_token_provider=lambda: self._credential.get_token("https://cognitiveservices.azure.com/.default").token,
-            api_version="2024-02-01"
-        )
+        Args:
+            max_tokens: Maximum tokens per assessment; raise it for longer reports
+        """
+        self.max_tokens = max_tokens
+        logger.debug("Risk Assessment Plugin initialized")
+        
+        # Reuse the shared OpenAI client
+        self.client = get_async_client()
     
     async def assess_risks(self, research_data: str, location: str = "", risk_categories: str = "") -> str:
         """
@@ -50,59 +140,125 @@ class RiskAssessmentPlugin:
             Detailed risk assessment report
         """
         try:
-            logger.info(f"Starting risk assessment for: '{location}'")
+            return "".join([
+                part async for part in self.assess_risks_stream(research_data, location, risk_categories)
+            ]).strip()
             
-            # Create system message for risk assessment
-            system_message = """You are an expert risk assessment analyst. Analyze the provided research data and perform a comprehensive risk assessment.
-
-Evaluate risks across these categories:
-🏗️ **Structural & Engineering Risks**
-🌍 **Environmental & Natural Disaster Risks**  
-🚨 **Safety & Security Risks**
-💰 **Financial & Economic Risks**
-🏛️ **Regulatory & Legal Risks**
-🚀 **Operational & Business Risks**
-
-For each relevant risk category, provide:
-- **Risk Level**: Critical/High/Medium/Low
-- **Likelihood**: Probability of occurrence  
-- **Impact**: Potential consequences
-- **Evidence**: Supporting data from research
-- **Key Concerns**: Specific issues identified
+        except Exception as e:
+            logger.exception("Error in risk assessment")
+            return f"❌ Error during risk assessment: {str(e)}\nPlease check your Azure OpenAI configuration."
 
-Format your response with clear headings and bullet points. Be specific and actionable based on the research data provided."""
+    async def assess_risks_stream(self, research_data: str, location: str = "",
+                                  risk_categories: str = "") -> AsyncIterator[str]:
+        """
+        Perform risk assessment and yield the report text as the model generates it
+        
+        Args:
+            research_data: Research findings about the location/building
+            location: Name or description of the location being assessed
+            risk_categories: Specific risk categories to focus on
+            
+        Yields:
+            Consecutive pieces of the risk assessment report
+        """
+        logger.info("Starting risk assessment for: '%s'", location)
+        
+        request = self._assessment_request(research_data, location, risk_categories)
+        
+        # Only assessments of the same location with the same focus are interchangeable; research
+        # reports share most of their boilerplate, so similar data alone doesn't mean the same site
+        semantic_key = ("risk_assessment", " ".join(location.split()).casefold(), risk_categories)
+        assessment_vector = None
+        if SEMANTIC_CACHE_ENABLED and not has_response(ASSESSMENT_CACHE, **request):
+            try:
+                assessment_vector = await SEMANTIC_ASSESSMENT_CACHE.embed(
+                    self.client, f"{location}\n{research_data}"[:SEMANTIC_CACHE_INPUT_CHARS], LLM_SEMAPHORE
+                )
+                cached_assessment = SEMANTIC_ASSESSMENT_CACHE.lookup(semantic_key, assessment_vector)
+                if cached_assessment is not None:
+                    yield cached_assessment
+                    return
+            except Exception:
+                logger.exception("Error embedding research data for the semantic cache")
+        
+        # Stream the OpenAI API response
+        parts = []
+        async for part in cached_completion_stream(self.client, ASSESSMENT_CACHE, LLM_SEMAPHORE, RATE_LIMITER, **request):
+            parts.append(part)
+            yield part
+        
+        if assessment_vector is not None:
+            SEMANTIC_ASSESSMENT_CACHE.add(semantic_key, assessment_vector, "".join(parts).strip())
+        
+        logger.info("Risk assessment completed for: '%s'", location)
 
-            # Create the assessment prompt
-            prompt = f"""Please perform a comprehensive risk assessment for: {location}
+    async def assess_risks_batch(self, items: List[Dict[str, str]]) -> List[str]:
+        """
+        Assess many locations at once through one Azure OpenAI Batch API job
+        
+        Batch jobs cost about half as much as online requests but can take
+        up to 24 hours, so this suits offline work such as portfolio-wide
+        re-assessments rather than interactive use.
+        
+        Args:
+            items: One dict per assessment with the keyword arguments of assess_risks
+                (research_data and optionally location and risk_categories)
+            
+        Returns:
+            The risk assessment report for each item, in input order
+        """
+        try:
+            requests = [self._assessment_request(**item) for item in items]
+            # Later online assessments of the same items are served from the cache
+            responses = await run_chat_completion_batch(self.client, requests, cache=ASSESSMENT_CACHE)
+        except Exception as e:
+            logger.exception("Error in batch risk assessment")
+            return [f"❌ Error during risk assessment: {str(e)}\nPlease check your Azure OpenAI configuration."] * len(items)
+        
+        assessments = []
+        for response in responses:
+            if response is None:
+                assessments.append("❌ Error during risk assessment: the batch request failed")
+            elif response.choices[0].message.content is None:
+                assessments.append("❌ Error during risk assessment: the response had no content")
+            else:
+                assessments.append(response.choices[0].message.content.strip())
+        
+        return assessments
 
-Based on this research data:
-{research_data}
+    def _assessment_request(self, research_data: str, location: str = "", risk_categories: str = "") -> Dict[str, Any]:
+        """Build the chat completion request for one risk assessment"""
+        
+        # Create the assessment prompt; the fixed wording comes first and the location last,
+        # so requests share as long a prefix as possible for Azure OpenAI prompt caching
+        prompt = f"""Please perform a comprehensive risk assessment based on this research data:
+{_clip(research_data)}
 
 Focus on: {risk_categories if risk_categories else 'all risk categories'}
 
+Target location: {location}
+
 Provide a detailed risk analysis."""
-            
-            # Make OpenAI API call
-            response = await self.client.chat.completions.create(
-                model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=2000
-            )
-            
-            # Extract and return the assessment content
-            assessment_content = response.choices[0].message.content
-            
-            logger.info(f"Risk assessment completed for: '{location}'")
-            
-            return assessment_content.strip()
-            
-        except Exception as e:
-            logger.error(f"Error in risk assessment: {e}")
-            return f"❌ Error during risk assessment: {str(e)}\nPlease check your Azure OpenAI configuration."
+        
+        # Temperature 0 keeps cached assessments representative
+        return {
+            "model": AZURE_OPENAI_CONFIG.deployment,
+            "messages": [
+                {"role": "system", "content": ASSESSMENT_SYSTEM_MESSAGE},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0,
+            "max_tokens": self.max_tokens
+        }
+
+
+def _clip(text: str, limit: int = MAX_RESEARCH_DATA_CHARS) -> str:
+    """Shorten text to about limit characters by cutting out its middle, keeping the head and the tail"""
+    if len(text) <= limit:
+        return text
+    
+    logger.info("Clipping research data from %d to %d characters", len(text), limit)
+    return text[:limit // 2] + "\n...[truncated]...\n" + text[-(limit // 2):]
 
 
 # Function definitions for OpenAI function calling
@@ -139,35 +295,31 @@ def get_risk_assessment_functions():
     ]
 
 
+# Built once; the schema never changes between calls
+RISK_ASSESSMENT_TOOLS = get_risk_assessment_functions()
+
+
 # Helper class for creating risk assessment agent using OpenAI
 class RiskAssessmentAgent:
     """
     An OpenAI-based risk assessment agent with function calling capabilities
     """
     
-    def __init__(self):
-        """Initialize the risk assessment agent with OpenAI client"""
-        self._credential = AzureCliCredential()
-        self.client = openai.AsyncAzureOpenAI(
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            azure_ad_token_provider=lambda: self._credential.get_token("https://cognitiveservices.azure.com/.default").token,
-            api_version="2024-02-01"
-        )
-        self.plugin = RiskAssessmentPlugin()
-        self.system_message = """You are an expert risk assessment analyst with deep expertise in evaluating various types of risks for locations, buildings, and assets. Your role is to provide comprehensive, actionable risk assessments based on research data.
-
-You have access to risk assessment functions that can help you analyze locations and buildings. When a user asks for risk assessment, you should:
-
-1. Use the assess_risks function to perform comprehensive analysis
-2. Provide detailed risk analysis covering:
-   - Structural & Engineering Risks
-   - Environmental & Natural Disaster Risks  
-   - Safety & Security Risks
-   - Financial & Economic Risks
-   - Regulatory & Legal Risks
-   - Operational & Business Risks
-
-Always provide professional, thorough, and actionable risk assessments that help users make informed decisions about locations, buildings, and assets."""
+    def __init__(self, max_tokens: int = DEFAULT_MAX_TOKENS):
+        """
+        Initialize the risk assessment agent with OpenAI client
+        
+        Args:
+            max_tokens: Maximum tokens per model response; raise it for longer reports
+        """
+        self.max_tokens = max_tokens
+        self.client = get_async_client()
+        self.plugin = RiskAssessmentPlugin(max_tokens)
+        self.tool_functions = {
+            "assess_risks": self.plugin.assess_risks,
+        }
+        self.direct_dispatches = 0
+        self.system_message = AGENT_SYSTEM_MESSAGE
 
     async def chat(self, message: str) -> str:
         """
@@ -180,70 +332,166 @@ Always provide professional, thorough, and actionable risk assessments that help
             Agent response as a string
         """
         try:
-            messages = [
-                {"role": "system", "content": self.system_message},
-                {"role": "user", "content": message}
-            ]
+            return "".join([part async for part in self.chat_stream(message)])
+            
+        except Exception as e:
+            logger.exception("Error in chat")
+            return f"❌ Chat failed: {str(e)}"
+
+    async def chat_stream(self, message: str) -> AsyncIterator[str]:
+        """
+        Chat with the risk assessment agent and yield its final answer as it is generated
+        
+        Each tool call starts running as soon as its arguments have streamed in,
+        while the rest of the tool-selection response is still arriving. The
+        final answer after the tool calls is streamed to the caller.
+        
+        Args:
+            message: The user's message or risk assessment request
             
+        Yields:
+            Consecutive pieces of the agent response
+        """
+        # Plain single-location assessment requests go straight to the plugin, skipping the tool-selection call
+        location = self._direct_assessment_location(message)
+        if location:
+            self.direct_dispatches += 1
+            logger.info("Dispatching risk assessment for '%s' directly (%d so far)", location, self.direct_dispatches)
+            async for part in self.plugin.assess_risks_stream(research_data=message, location=location):
+                yield part
+            return
+        
+        messages = [
+            {"role": "system", "content": self.system_message},
+            {"role": "user", "content": message}
+        ]
+        
+        # Tool calls already running, keyed by tool call id
+        started: Dict[str, "asyncio.Task[Tuple[str, str]]"] = {}
+        try:
             # First call to potentially trigger function calling
-            response = await self.client.chat.completions.create(
-                model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-                messages=messages,
-                tools=get_risk_assessment_functions(),
-                tool_choice="auto",
-                temperature=0.7,
-                max_tokens=2000
-            )
+            response_message = await self._route_call(messages, started)
             
-            response_message = response.choices[0].message
+            # No function call needed, return the direct response
+            if not response_message.tool_calls:
+                yield response_message.content
+                return
             
-            # Check if the model wants to call a function
-            if response_message.tool_calls:
-                # Add the assistant's response to messages
-                messages.append({
-                    "role": "assistant", 
-                    "content": response_message.content,
-                    "tool_calls": response_message.tool_calls
-                })
-                
-                # Execute each function call
-                for tool_call in response_message.tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-                    
-                    # Call the appropriate function
-                    if function_name == "assess_risks":
-                        function_response = await self.plugin.assess_risks(
-                            research_data=function_args.get("research_data"),
-                            location=function_args.get("location", ""),
-                            risk_categories=function_args.get("risk_categories", "")
-                        )
-                    else:
-                        function_response = f"Unknown function: {function_name}"
-                    
-                    # Add function response to messages
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": function_response
-                    })
-                
-                # Get final response from the model
-                final_response = await self.client.chat.completions.create(
-                    model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=2000
-                )
-                
-                return final_response.choices[0].message.content
-            else:
-                # No function call needed, return the direct response
-                return response_message.content
+            # Add the assistant's response to messages
+            messages.append({
+                "role": "assistant", 
+                "content": response_message.content,
+                "tool_calls": response_message.tool_calls
+            })
             
-        except Exception as e:
-            logger.error(f"Error in chat: {e}")
-            return f"❌ Chat failed: {str(e)}"
+            # Execute the remaining function calls concurrently, keeping their original order
+            results = await asyncio.gather(
+                *(started.get(tool_call.id) or dispatch_tool_call(tool_call, self.tool_functions, RISK_ASSESSMENT_TOOLS)
+                  for tool_call in response_message.tool_calls)
+            )
+        finally:
+            # Don't leave tool calls running when the turn fails or the caller stops early
+            for task in started.values():
+                task.cancel()
+        
+        # Add function responses to messages
+        for tool_call_id, function_response in results:
+            messages.append({
+                "role": "tool",
+                "tool_call_id": tool_call_id,
+                "content": function_response
+            })
+        
+        # Stream the final response from the model
+        async for part in self._final_call(messages):
+            yield part
+
+    async def _route_call(self, messages: List[Dict[str, Any]],
+                          started: Dict[str, "asyncio.Task[Tuple[str, str]]"]) -> ChatCompletionMessage:
+        """
+        Let the model decide on tool calls, deterministically
+        
+        The response is streamed so each tool call can be dispatched as soon as
+        its arguments are complete; the tasks are added to started.
+        
+        Args:
+            messages: The conversation so far
+            started: Receives the dispatched tool call tasks, keyed by tool call id
+            
+        Returns:
+            The assistant message with its content and tool calls
+        """
+        # Deterministic requests can be answered from the exact-match cache
+        request = dict(
+            model=AZURE_OPENAI_CONFIG.deployment,
+            messages=messages,
+            tools=RISK_ASSESSMENT_TOOLS,
+            tool_choice="auto",
+            temperature=0,
+            seed=ROUTE_SEED,
+            max_tokens=self.max_tokens
+        )
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+        
+        def on_chunk(chunk: Any) -> None:
+            for tool_call_delta in (chunk.choices[0].delta.tool_calls or []) if chunk.choices else []:
+                tool_call = tool_calls.setdefault(tool_call_delta.index, {"id": "", "name": "", "arguments": ""})
+                if tool_call_delta.id:
+                    tool_call["id"] = tool_call_delta.id
+                if tool_call_delta.function:
+                    tool_call["name"] += tool_call_delta.function.name or ""
+                    tool_call["arguments"] += tool_call_delta.function.arguments or ""
+                    # The arguments form one JSON object, so they can only be complete once a "}" arrives
+                    if "}" in (tool_call_delta.function.arguments or "") and tool_call["id"] not in started:
+                        self._start_tool_call(tool_call, started)
+        
+        # On a cache hit or a coalesced duplicate no chunks arrive, and the tool calls are dispatched afterwards
+        response = await cached_completion(
+            self.client, ASSESSMENT_CACHE, LLM_SEMAPHORE, RATE_LIMITER, on_chunk, **request, stream=True
+        )
+        return response.choices[0].message
+
+    def _start_tool_call(self, tool_call: Dict[str, str], started: Dict[str, "asyncio.Task[Tuple[str, str]]"]) -> None:
+        """Dispatch a streamed tool call in the background once its arguments parse as complete JSON"""
+        try:
+            json_loads(tool_call["arguments"])
+        except ValueError:
+            return
+        started[tool_call["id"]] = asyncio.create_task(dispatch_tool_call(
+            ChatCompletionMessageToolCall(
+                id=tool_call["id"],
+                type="function",
+                function=Function(name=tool_call["name"], arguments=tool_call["arguments"])
+            ),
+            self.tool_functions,
+            RISK_ASSESSMENT_TOOLS
+        ))
+
+    async def _final_call(self, messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        """Stream the model's final answer once the tool results are in the conversation"""
+        
+        async for part in cached_completion_stream(
+            self.client, ASSESSMENT_CACHE, LLM_SEMAPHORE, RATE_LIMITER,
+            model=AZURE_OPENAI_CONFIG.deployment,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=self.max_tokens
+        ):
+            yield part
+
+    @staticmethod
+    def _direct_assessment_location(message: str) -> str:
+        """Return the location of a plain single-location assessment request, or "" if the model should decide"""
+        
+        match = DIRECT_ASSESSMENT_PATTERN.match(message)
+        if not match:
+            return ""
+        
+        location = match.group("location")
+        if (MULTIPLE_LOCATIONS_PATTERN.search(location) or FOCUS_CLAUSE_PATTERN.search(location)
+                or FOLLOW_UP_SENTENCE_PATTERN.search(location)):
+            return ""
+        return location.strip()
 
 
 def create_risk_assessment_agent() -> RiskAssessmentAgent:
@@ -7,11 +7,24 @@ with OpenAI function calling instead of Semantic Kernel.
 """
 
 import asyncio
+import logging
 import os
-from deep_research_plugin import DeepResearchPlugin, DeepResearchAgent, create_deep_research_agent
+from typing import TYPE_CHECKING
+from dotenv import load_dotenv
 
+# The plugin modules pull in openai and azure.identity, so they are imported only once a test actually runs
+if TYPE_CHECKING:
+    from deep_research_plugin import DeepResearchAgent
 
-async def test_openai_deep_research():
+load_dotenv()
+
+
+def azure_openai_configured() -> bool:
+    """Whether the Azure OpenAI settings the tests need are present"""
+    return bool(os.getenv("AZURE_OPENAI_ENDPOINT") and os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"))
+
+
+async def test_openai_deep_research(agent: "DeepResearchAgent"):
     """Test the OpenAI-based Deep Research Plugin functionality"""
     
     print("🚀 Testing OpenAI-based Deep Research Plugin")
@@ -20,7 +33,7 @@ async def test_openai_deep_research():
     # Test 1: Direct Plugin Testing
     print("\n📋 Test 1: Direct Plugin Usage")
     print("-" * 30)
-    plugin = DeepResearchPlugin()
+    plugin = agent.plugin
     
     try:
         result1 = await plugin.quick_research("artificial intelligence trends")
@@ -45,41 +58,29 @@ async def test_openai_deep_research():
     print("\n📋 Test 3: Agent with Function Calling")
     print("-" * 30)
     
-    if os.getenv("AZURE_OPENAI_ENDPOINT") and os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"):
-        try:
-            agent = create_deep_research_agent()
-            
-            # Test function calling with a research request
-            response = await agent.chat("Please perform a quick research on blockchain technology trends")
-            print("✅ Agent function calling completed!")
-            print("Response length:", len(response))
-            print("First 300 characters:", response[:300] + "...")
-            
-            # Test direct conversation
-            response2 = await agent.chat("What are the main benefits of using AI in healthcare?")
-            print("\n✅ Direct conversation completed!")
-            print("Response length:", len(response2))
-            print("First 300 characters:", response2[:300] + "...")
-            
-        except Exception as e:
-            print(f"❌ Agent testing failed: {e}")
-    else:
-        print("⚠️  Azure OpenAI configuration not found. Skipping agent test.")
-        print("Please ensure AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_DEPLOYMENT_NAME are set.")
+    try:
+        # Test function calling with a research request
+        response = await agent.chat("Please perform a quick research on blockchain technology trends")
+        print("✅ Agent function calling completed!")
+        print("Response length:", len(response))
+        print("First 300 characters:", response[:300] + "...")
+        
+        # Test direct conversation
+        response2 = await agent.chat("What are the main benefits of using AI in healthcare?")
+        print("\n✅ Direct conversation completed!")
+        print("Response length:", len(response2))
+        print("First 300 characters:", response2[:300] + "...")
+        
+    except Exception as e:
+        print(f"❌ Agent testing failed: {e}")
 
 
-async def test_function_calling_scenarios():
+async def test_function_calling_scenarios(agent: "DeepResearchAgent"):
     """Test various function calling scenarios"""
     
     print("\n🔧 Testing Function Calling Scenarios")
     print("=" * 50)
     
-    if not (os.getenv("AZURE_OPENAI_ENDPOINT") and os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")):
-        print("⚠️  Azure OpenAI configuration not found. Skipping function calling tests.")
-        return
-    
-    agent = create_deep_research_agent()
-    
     # Test scenarios that should trigger function calls
     scenarios = [
         "Research the latest trends in quantum computing",
@@ -88,16 +89,18 @@ async def test_function_calling_scenarios():
         "Perform deep research on cybersecurity challenges with 4 aspects and 3 iterations",
     ]
     
-    for i, scenario in enumerate(scenarios, 1):
+    # Run all scenarios concurrently; the shared semaphore and rate limiter keep them within quota
+    responses = await asyncio.gather(*(agent.chat(scenario) for scenario in scenarios), return_exceptions=True)
+    
+    for i, (scenario, response) in enumerate(zip(scenarios, responses), 1):
         print(f"\n📝 Scenario {i}: {scenario}")
         print("-" * 40)
-        try:
-            response = await agent.chat(scenario)
-            print("✅ Response received!")
-            print("Length:", len(response))
-            print("Preview:", response[:150] + "..." if len(response) > 150 else response)
-        except Exception as e:
-            print(f"❌ Scenario {i} failed: {e}")
+        if isinstance(response, Exception):
+            print(f"❌ Scenario {i} failed: {response}")
+            continue
+        print("✅ Response received!")
+        print("Length:", len(response))
+        print("Preview:", response[:150] + "..." if len(response) > 150 else response)
 
 
 async def main():
@@ -105,15 +108,30 @@ async def main():
     print("🧪 OpenAI-based Deep Research Plugin Test Suite")
     print("=" * 60)
     
+    if not azure_openai_configured():
+        print("⚠️  Azure OpenAI configuration not found. Skipping all tests.")
+        print("Please ensure AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_DEPLOYMENT_NAME are set.")
+        return
+    
+    from azure_openai_client import close_async_client
+    from deep_research_plugin import create_deep_research_agent
+    
+    # One agent (and its plugin) serves every test, so they share warm connections and caches
+    agent = create_deep_research_agent()
+    
     # Run basic plugin tests
-    await test_openai_deep_research()
+    await test_openai_deep_research(agent)
     
     # Run function calling tests
-    await test_function_calling_scenarios()
+    await test_function_calling_scenarios(agent)
+    
+    # Release the shared Azure OpenAI connections
+    await close_async_client()
     
     print("\n" + "=" * 60)
     print("🏁 Test suite completed!")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(main())
\ No newline at end of file